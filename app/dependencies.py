@@ -1,15 +1,34 @@
 from typing import Annotated
 
 from fastapi import Depends
-from sqlmodel import Session
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
 from database import engine
 
-def get_database_session():
+# Factory of the async sessions used to interact with the database
+session_factory = async_sessionmaker(engine, class_=AsyncSession)
+
+def get_session_factory():
+    """
+        Returns the factory used to open database sessions. Endpoints that
+        read the database after the request ends, like streamed responses,
+        open their own session with it.
+    """
+    return session_factory
+
+# Session factory dependency type
+SessionFactoryDep = Annotated[async_sessionmaker[AsyncSession],
+                              Depends(get_session_factory)]
+
+async def get_database_session(factory: SessionFactoryDep):
     """
-        Yields a session object to interact with the database.
+        Yields an async session object to interact with the database.
+
+        The whole request runs in a single transaction, committed once the
+        endpoint returns or rolled back if it raises an exception.
     """
-    with Session(engine) as session:
+    async with factory() as session, session.begin():
         yield session
 
 # Session dependency type
-DatabaseDep = Annotated[Session, Depends(get_database_session)]
+DatabaseDep = Annotated[AsyncSession, Depends(get_database_session)]
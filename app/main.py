@@ -1,9 +1,10 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from routes import task_router
 
-# Main app configuration
-app = FastAPI()
+# Main app configuration, responses are serialized with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Include the task router
 app.include_router(task_router)
@@ -2,9 +2,10 @@ from datetime import datetime
 from typing import Optional
 
 import pydantic as pyd
+from sqlalchemy import DDL, column, event, table
 from sqlmodel import Field, SQLModel
 
-from utils import datetime_now
+from utils import datetime_now, reject_null
 
 
 # Base task model
@@ -23,9 +24,45 @@ class BaseTask(SQLModel):
 # Database model for tasks
 class Task(BaseTask, SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Last modification date, bumped by SQLAlchemy on every UPDATE
+    updated_at: datetime = Field(
+        default_factory=datetime_now,
+        sa_column_kwargs={"default": datetime_now, "onupdate": datetime_now},
+    )
 
 
-# Model used to create and update (PUT) new tasks
+# Full-text index used to search tasks by a substring of their title. The
+# trigram tokenizer lets SQLite answer "LIKE '%...%'" queries from the index
+# instead of scanning the whole task table.
+task_fts = table("task_fts", column("rowid"), column("title"))
+
+# The FTS table only stores the index, the content is read from the task table
+# and kept in sync by triggers
+for statement in (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(
+        title, content='task', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task BEGIN
+        INSERT INTO task_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task BEGIN
+        INSERT INTO task_fts(task_fts, rowid, title)
+        VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE OF title
+    ON task BEGIN
+        INSERT INTO task_fts(task_fts, rowid, title)
+        VALUES ('delete', old.id, old.title);
+        INSERT INTO task_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    # Index the tasks that existed before the FTS table was created
+    "INSERT INTO task_fts(task_fts) VALUES ('rebuild')",
+):
+    event.listen(SQLModel.metadata, "after_create",
+                 DDL(statement).execute_if(dialect="sqlite"))
+
+
+# Model used to create new tasks
 class TaskCreate(BaseTask):
     pass # Just in case something changes in the future
 
@@ -35,8 +72,26 @@ class TaskPublic(BaseTask):
     id: int
 
 
+# Model used to update (PUT) tasks
+class TaskUpdate(pyd.BaseModel):
+    # Every field defaults to None, so only the fields sent by the client are
+    # set and the ones left out are not overwritten with their defaults
+    title: Optional[str] = pyd.Field(default=None, max_length=120)
+    description: Optional[str] = pyd.Field(default=None, max_length=255)
+    completed: Optional[bool] = pyd.Field(default=None)
+    created_at: Optional[datetime] = pyd.Field(default=None)
+
+    # Defaults aren't validated, so this only rejects an explicit null
+    _reject_null = pyd.field_validator(
+        "title", "completed", "created_at", mode="after"
+    )(reject_null)
+
+
 # Model used to handle task patches
 class TaskPatch(pyd.BaseModel):
+    # Unknown fields are dropped by pydantic-core before reaching the handler
+    model_config = pyd.ConfigDict(extra="ignore")
+
     # Make the title optional since this is a patch model
     title: Optional[str] = pyd.Field(default=None,max_length=120)
     # The task description was optional since the beginning
@@ -46,3 +101,24 @@ class TaskPatch(pyd.BaseModel):
     # The creation date must default to None in order to not change anything
     created_at: Optional[datetime] = pyd.Field(default=None)
 
+    # The title and the creation date can't be null in the database
+    _reject_null = pyd.field_validator(
+        "title", "created_at", mode="after"
+    )(reject_null)
+
+
+# Model used to show a page of tasks to the users
+class TaskPage(pyd.BaseModel):
+    # Tasks of the requested page
+    items: list[TaskPublic]
+    # Number of tasks matching the criteria, regardless of the pagination
+    total: int
+    # Pagination parameters used to build the page
+    offset: int
+    limit: int
+
+
+# Validators and serializers of the public task models. Their core schemas are
+# built once at import, before the first request.
+TaskPublicAdapter = pyd.TypeAdapter(TaskPublic)
+TaskPublicListAdapter = pyd.TypeAdapter(list[TaskPublic])
@@ -1,91 +1,201 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
 from fastapi import (
     APIRouter, 
     Body, 
+    Header, 
     HTTPException, 
     Path, 
     Query, 
+    Response, 
     status
 )
-from sqlmodel import col, select
-
-from models import Task, TaskCreate, TaskPatch, TaskPublic
-from dependencies import DatabaseDep
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam
+from sqlmodel import col, delete, func, insert, select, update
+
+from models import (
+    Task, 
+    TaskCreate, 
+    TaskPage, 
+    TaskPatch, 
+    TaskPublic, 
+    TaskPublicAdapter, 
+    TaskPublicListAdapter, 
+    TaskUpdate, 
+    task_fts
+)
+from dependencies import DatabaseDep, SessionFactoryDep
+from utils import LRUCache
 
 
 task_router = APIRouter(prefix="/task", tags=["tasks"])
 
-@task_router.get("/", response_model=list[TaskPublic])
-def list_tasks(
-    db_session: DatabaseDep,
+# ETag and serialized details of the tasks, keyed by task ID
+task_details_cache = LRUCache(maxsize=4096)
+
+# Columns shown to the users. The read endpoints select them from the table
+# directly, so the rows are serialized without building Task objects.
+_PUBLIC_COLUMNS = [Task.__table__.c[name] for name in TaskPublic.model_fields]
+
+# Statements used to list the tasks. They are built once with bound
+# parameters, so every request reuses the same compiled SQL.
+_LIST_STATEMENT = (select(*_PUBLIC_COLUMNS).offset(bindparam("offset"))
+                   .limit(bindparam("limit")))
+# Count statement, computed by the database instead of loading every row
+_COUNT_STATEMENT = select(func.count()).select_from(Task.__table__)
+# Look up the IDs matching the title in the full-text index. SQLite's LIKE is
+# already case-insensitive.
+_TITLE_FILTER = Task.__table__.c.id.in_(
+    select(task_fts.c.rowid).where(task_fts.c.title.like(bindparam("title")))
+)
+_FILTERED_LIST_STATEMENT = _LIST_STATEMENT.where(_TITLE_FILTER)
+_FILTERED_COUNT_STATEMENT = _COUNT_STATEMENT.where(_TITLE_FILTER)
+# Statements used to detail a task. The first one only reads the modification
+# date, which is enough to know whether the client or the cache has the current
+# version of the task.
+_UPDATED_AT_STATEMENT = (select(Task.__table__.c.updated_at)
+                         .where(Task.__table__.c.id == bindparam("task_id")))
+_DETAILS_STATEMENT = (select(Task.__table__.c.updated_at, *_PUBLIC_COLUMNS)
+                      .where(Task.__table__.c.id == bindparam("task_id")))
+
+async def stream_task_page(session_factory, statement, count_statement, 
+                           params, offset, limit):
+    """
+    Yields a TaskPage JSON document chunk by chunk, serializing the tasks
+    while they are fetched from the database.
+
+    The request session is already closed when the response body is sent, so
+    the tasks are read from a session of its own. The total is counted in the
+    same transaction, so it always agrees with the streamed page.
+    """
+    async with session_factory() as session, session.begin():
+        total = (await session.exec(count_statement, params=params)).one()
+        yield b'{"items":['
+        # No task matches the criteria, there's nothing to read
+        if total:
+            task_stream = await session.stream(
+                statement, params, execution_options={"yield_per": 100}
+            )
+            separator = b""
+            # Serialize each chunk of rows in a single pydantic-core call
+            async for task_chunk in task_stream.partitions():
+                task_chunk = TaskPublicListAdapter.validate_python(
+                    task_chunk, from_attributes=True
+                )
+                # Drop the brackets, the chunks are joined in the same array
+                task_chunk = TaskPublicListAdapter.dump_json(task_chunk)[1:-1]
+                yield separator + task_chunk
+                separator = b","
+        yield b'],"total":%d,"offset":%d,"limit":%d}' % (total, offset, limit)
+
+
+@task_router.get("/", response_model=TaskPage)
+async def list_tasks(
+    session_factory: SessionFactoryDep,
     offset: Annotated[int, Query(ge=0)]=0,
     limit: Annotated[int, Query(ge=0)]=20,
     title: Annotated[str, Query(max_length=120)] = "",
 ):
     """
-    Retrieve a list of tasks from the database with optional filtering and pagination.
+    Retrieve a page of tasks from the database with optional filtering and pagination.
 
     Parameters:
-        db_session (DatabaseDep): Dependency-injected database session.
+        session_factory (SessionFactoryDep): Dependency-injected factory of the session used to stream the tasks.
         offset (int, optional): Number of items to skip before starting to collect the result set. Must be >= 0. Default is 0.
         limit (int, optional): Maximum number of items to return. Must be >= 0. Default is 20.
         title (str, optional): Optional title filter. Returns tasks whose titles contain this string (case-insensitive). Max length is 120 characters.
 
     Returns:
-        list[Task]: A list of Task objects matching the criteria.
-
-    Raises:
-        HTTPException: If no tasks are found matching the criteria, raises a 404 NOT FOUND.
+        StreamingResponse: A TaskPage with the requested page of Task objects
+            along with the total number of tasks matching the criteria. The
+            page is empty if no task matches the criteria.
     """
-    # Select statement
-    statement = select(Task).offset(offset).limit(limit)
+    params = {"offset": offset, "limit": limit}
+    statement, count_statement = _LIST_STATEMENT, _COUNT_STATEMENT
 
     # Filter the tasks by title
     if title:
-        statement = statement.where(col(Task.title).ilike(f"%{title}%"))
+        params["title"] = f"%{title}%"
+        statement = _FILTERED_LIST_STATEMENT
+        count_statement = _FILTERED_COUNT_STATEMENT
 
-    # Get all the tasks 
-    task_list = db_session.exec(statement).all()
-
-    # Raise an HTTP status 404 NOT FOUND if the list is empty
-    if not task_list:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail="The tasks list is empty.") 
-    
-
-    return list(task_list)
+    # Stream the tasks of the requested page as they are read
+    return StreamingResponse(
+        stream_task_page(session_factory, statement, count_statement, params, 
+                         offset, limit),
+        media_type="application/json",
+    )
 
 
 @task_router.get("/{task_id}", response_model=TaskPublic)
-def task_details(
+async def task_details(
     db_session: DatabaseDep,
     task_id: Annotated[int, Path(ge=0)],
-) -> Task:
+    if_none_match: Annotated[Optional[str], Header()] = None,
+) -> Response:
     """
     Retrieve a task from the database and return its details.
 
+    The response carries an ETag built from the task modification date. If
+    the client already has the current version (If-None-Match), a 304 NOT
+    MODIFIED is returned without loading nor serializing the task.
+
     Parameters:
         db_session (DatabaseDep): Dependency-injected database session.
         task_id: ID of the task to be detailed.
+        if_none_match (str, optional): ETags of the versions cached by the client.
 
     Returns:
-        Task: Details of the Task object retrieved by its ID.
+        Response: Details of the Task object retrieved by its ID.
 
     Raises:
         HTTPException: If the task with the given ID does not exist, raises a 404 NOT FOUND.
     """
-    # Retrieve the task from the database
-    task_db = db_session.get(Task, task_id)
+    params = {"task_id": task_id}
+    task_row = None
+    cached = task_details_cache.get(task_id)
+    if if_none_match or cached is not None:
+        # Only the modification date is needed to know the current version
+        updated_at = (await db_session.exec(_UPDATED_AT_STATEMENT, 
+                                            params=params)).first()
+    else:
+        # Nothing to compare with, read the whole task in a single query
+        task_row = (await db_session.exec(_DETAILS_STATEMENT, 
+                                          params=params)).first()
+        updated_at = task_row.updated_at if task_row else None
     # Raise an HTTPException if the task with the given ID does not exist
-    if not task_db:
+    if updated_at is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Task not found")
-    return task_db
+    etag = f'W/"{task_id}-{int(updated_at.timestamp() * 1_000_000)}"'
+    headers = {"ETag": etag}
+
+    # The client already has this version of the task. If-None-Match uses the
+    # weak comparison, so the W/ prefix is ignored on both sides.
+    client_etags = {tag.strip().removeprefix("W/")
+                    for tag in (if_none_match or "").split(",")}
+    if "*" in client_etags or etag.removeprefix("W/") in client_etags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers=headers)
+
+    # Serialize the task only if this version isn't cached yet
+    if cached is not None and cached[0] == etag:
+        content = cached[1]
+    else:
+        if task_row is None:
+            task_row = (await db_session.exec(_DETAILS_STATEMENT, 
+                                              params=params)).first()
+        task_public = TaskPublicAdapter.validate_python(task_row,
+                                                        from_attributes=True)
+        content = TaskPublicAdapter.dump_json(task_public)
+        task_details_cache.set(task_id, (etag, content))
+
+    return Response(content, media_type="application/json", headers=headers)
 
 
 @task_router.post("/", response_model=TaskPublic, status_code=201)
-def create_task(
+async def create_task(
     db_session: DatabaseDep,
     task_body: Annotated[TaskCreate, Body()],
 ):
@@ -103,29 +213,62 @@ def create_task(
     db_task = Task.model_validate(task_body)
     # Add the object to the database
     db_session.add(db_task)
-    db_session.commit()
+    # Send the INSERT now, the request transaction commits it once the
+    # response is ready
+    await db_session.flush()
     # Refresh the object by retrieving data from the database
-    db_session.refresh(db_task)
+    await db_session.refresh(db_task)
 
     return db_task
 
 
+@task_router.post("/bulk", response_model=list[TaskPublic], status_code=201)
+async def create_tasks_bulk(
+    db_session: DatabaseDep,
+    task_body: Annotated[list[TaskCreate], Body(min_length=1, max_length=1000)],
+):
+    """
+    Create many tasks in the database at once.
+
+    All the tasks are inserted with a single INSERT statement and saved with a
+    single commit, instead of paying for a commit on every task. At most 1000
+    tasks are accepted per request, so a single batch doesn't hold SQLite's
+    write lock for too long.
+
+    Parameters:
+        db_session (DatabaseDep): Dependency-injected database session.
+        task_body (list[TaskCreate]): Task body objects of the HTTP request, between 1 and 1000.
+
+    Returns:
+        list[TaskPublic]: The Task objects created, in the same order.
+    """
+    # Insert every task and get back the stored rows, IDs included
+    statement = insert(Task).returning(*Task.__table__.columns, 
+                                       sort_by_parameter_order=True)
+    task_list = (await db_session.execute(
+        statement, [task.model_dump() for task in task_body]
+    )).mappings().all()
+
+    return task_list
+
+
 @task_router.put("/{task_id}", response_model=TaskPublic)
-def update_task(
+async def update_task(
     db_session: DatabaseDep,
     task_id: Annotated[int, Path(ge=1)],
-    task_body: Annotated[TaskCreate, Body()],
-) -> Task:
+    task_body: Annotated[TaskUpdate, Body()],
+):
     """
     Update an existing task by ID with new data.
 
-    This endpoint retrieves a task by its ID from the database, updates its fields
-    with the values provided in the request body, and commits the changes.
+    This endpoint updates the fields of the task with the given ID with the
+    values provided in the request body. The updated task is read back by the
+    same UPDATE statement.
 
     Parameters:
         db_session (DatabaseDep): Dependency-injected database session.
         task_id (int): ID of the task to retrieve from the database.
-        task_body (TaskCreate): The new task data. Fields not included will be left unchanged.
+        task_body (TaskUpdate): The new task data. Fields not included will be left unchanged.
 
     Returns:
         Task: The updated task object.
@@ -133,34 +276,31 @@ def update_task(
     Raises:
         HTTPException: If the task with the given ID does not exist, raises a 404 NOT FOUND.
     """
-    # Look for the task to update in the database
-    task_db = db_session.get(Task, task_id)
+    # Only the fields sent by the client are updated
+    task_data = task_body.model_dump(exclude_unset=True)
+    # Update the task and read it back in a single round trip
+    statement = (update(Task).where(col(Task.id) == task_id).values(task_data)
+                 .returning(*Task.__table__.columns))
+    task_db = (await db_session.execute(statement)).mappings().one_or_none()
     if not task_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Task not found")
-    # The TaskCreate model also works for PUT methods
-    task_data = task_body.model_dump(exclude_unset=True)
-    # Add the new data to the database model
-    task_db.sqlmodel_update(task_data)
-    db_session.add(task_db)
-    # Save changes and return the object to the client
-    db_session.commit()
-    db_session.refresh(task_db)
 
     return task_db
 
 
 @task_router.patch("/{task_id}", response_model=TaskPublic)
-def patch_task(
+async def patch_task(
     db_session: DatabaseDep,
     task_id: Annotated[int, Path(ge=0)],
     task_body: Annotated[TaskPatch, Body()],
 ):
     """
-    Retrieve a task from the database, then update some fields with new data.
+    Update some fields of a task from the database with new data.
     
-    This endpoint retrieves a task from the database by its ID, updates some 
-    fields with the data provided in the request body and commits the changes.
+    This endpoint updates some fields of the task with the given ID with the
+    data provided in the request body. The updated task is read back by the
+    same UPDATE statement.
 
     Parameters:
         db_session (DatabaseDep): Dependency-injected database session.
@@ -173,21 +313,19 @@ def patch_task(
     Raises:
         HTTPException: If the task with the given ID was not found, raises a 404 NOT FOUND
     """
-    task_db = db_session.get(Task, task_id)
+    task_data = task_body.model_dump(exclude_unset=True)
+    statement = (update(Task).where(col(Task.id) == task_id).values(task_data)
+                 .returning(*Task.__table__.columns))
+    task_db = (await db_session.execute(statement)).mappings().one_or_none()
     if not task_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Task not found")
-    task_data = task_body.model_dump(exclude_unset=True)
-    task_db.sqlmodel_update(task_data)
-    db_session.add(task_db)
-    db_session.commit()
-    db_session.refresh(task_db)
 
     return task_db
 
 
 @task_router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_task(
+async def delete_task(
     db_session: DatabaseDep,
     task_id: Annotated[int, Path()],
 ):
@@ -201,13 +339,16 @@ def delete_task(
         task_id (int): ID of the task to be deleted:
 
     returns:
-        dict: A confirmation message with {"ok": True} upon successful deletion.
+        Response: An empty 204 NO CONTENT response upon successful deletion.
+
+    Raises:
+        HTTPException: If the task with the given ID does not exist, raises a 404 NOT FOUND.
     """
-    task_db = db_session.get(Task, task_id)
-    if not task_db:
+    # Delete the task in a single round trip, no ID is returned if it didn't
+    # exist
+    statement = delete(Task).where(col(Task.id) == task_id).returning(Task.id)
+    if (await db_session.execute(statement)).first() is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Task not found")
-    db_session.delete(task_db)
-    db_session.commit()
 
-    return {"ok": True}
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,8 +1,53 @@
+from collections import OrderedDict
 from datetime import datetime, timezone
+from typing import Any, Hashable, Optional
+
+
+# Bound once to skip the attribute lookup on every call
+_UTC = timezone.utc
 
 
 def datetime_now() -> datetime:
     """
     Returns the actual date and time in UTC
     """
-    return datetime.now(timezone.utc)
+    return datetime.now(_UTC)
+
+
+def reject_null(value: Any) -> Any:
+    """
+    Field validator that rejects an explicit null for optional fields whose
+    database column isn't nullable
+    """
+    if value is None:
+        raise ValueError("Value can't be null")
+    return value
+
+
+class LRUCache:
+    """
+    Small in-process cache that discards the least recently used entries
+    once it holds more than maxsize items.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the value stored for the key, or None if it isn't cached.
+        """
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            return None
+        return self._entries[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a value for the key, evicting the oldest entry if needed.
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)